@@ -0,0 +1,89 @@
+"""
+Canonical JSON encoder for app compose hashing
+
+Kept free of dynamic tricks and fully annotated so it can be compiled in
+place with mypyc (`mypyc canonical.py`); the interpreter then loads the
+native extension instead of this file. The pure-Python module behaves
+identically when no compiled build is present.
+"""
+
+import json
+import math
+
+
+def _dumps_scalar(obj: object) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _key_str(key: object) -> str:
+    """Stringify a dict key the way json.dumps does, rejecting the same types."""
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, (int, float)):
+        # Covers bool (an int subclass): true/false/null, ints and floats as JSON
+        return _dumps_scalar(key)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {key.__class__.__name__}")
+
+
+def encode_into(obj: object, out: bytearray) -> None:
+    """Append the canonical JSON encoding of obj to out in a single pass.
+
+    Dict keys are sorted lexicographically and NaN/Infinity become null,
+    matching the DStack SDK serialization byte for byte.
+    """
+    if isinstance(obj, dict):
+        out += b"{"
+        first = True
+        # Sort keys alone rather than (key, value) pairs: keys are unique, so the
+        # order is the same, and Timsort is a single linear pass when the
+        # mapping is already in canonical order (typical for generated configs)
+        for key in sorted(obj):
+            value = obj[key]
+            if not first:
+                out += b","
+            first = False
+            out += _dumps_scalar(_key_str(key)).encode("utf-8")
+            out += b":"
+            encode_into(value, out)
+        out += b"}"
+    elif isinstance(obj, list):
+        out += b"["
+        first = True
+        for item in obj:
+            if not first:
+                out += b","
+            first = False
+            encode_into(item, out)
+        out += b"]"
+    elif isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
+        # NaN and Infinity are not valid JSON; emit null for deterministic output
+        out += b"null"
+    else:
+        out += _dumps_scalar(obj).encode("utf-8")
+
+
+def canonical_bytes(obj: object) -> bytes:
+    """Return the canonical JSON encoding of obj as UTF-8 bytes."""
+    out = bytearray()
+    encode_into(obj, out)
+    return bytes(out)
+
+
+def is_plain_json(obj: object) -> bool:
+    """Return True if the tree holds only dict, list, str, int, bool and None.
+
+    Exact types only: floats, tuples, dates, UUIDs, enums and subclasses are
+    rejected, since those are where a C encoder such as orjson can disagree
+    with json.dumps (float formatting, tuple contents, extra supported types).
+    """
+    if type(obj) is dict:
+        for key, value in obj.items():
+            if type(key) is not str or not is_plain_json(value):
+                return False
+        return True
+    elif type(obj) is list:
+        for item in obj:
+            if not is_plain_json(item):
+                return False
+        return True
+    return obj is None or type(obj) is str or type(obj) is int or type(obj) is bool
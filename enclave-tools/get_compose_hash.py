@@ -7,55 +7,72 @@ Based on DStack SDK implementation for deterministic JSON serialization
 import hashlib
 import json
 import yaml
+from canonical import canonical_bytes, is_plain_json
 from typing import Any, Dict, List, Optional, Union
 
-
-def sort_object(obj: Any) -> Any:
-    """Recursively sort object keys lexicographically for deterministic JSON."""
-    if obj is None:
-        return obj
-    elif isinstance(obj, list):
-        return [sort_object(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {key: sort_object(value) for key, value in sorted(obj.items())}
-    else:
-        return obj
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError as e:
+    raise RuntimeError(
+        "PyYAML was built without libyaml; reinstall it with libyaml available "
+        "(e.g. apt install libyaml-dev && pip install --force-reinstall --no-binary pyyaml pyyaml)"
+    ) from e
+
+try:
+    import orjson
+except ImportError:  # canonical.canonical_bytes is used instead
+    orjson = None
+
+# hashlib's OpenSSL backend picks SHA-NI / ARMv8 SHA2 instructions at runtime when
+# the CPU has them; Python builds without OpenSSL fall back to the scalar builtin.
+SHA256_BACKEND = "openssl" if hashlib.sha256.__name__ == "openssl_sha256" else "builtin"
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def to_deterministic_bytes(data: Dict[str, Any]) -> bytes:
+    """Serialize to deterministic UTF-8 JSON bytes following cross-language standards."""
+    # orjson sorts and serializes in C, but it formats floats differently from
+    # Python's json (1e16 vs 1e+16), also serializes dates, UUIDs, enums and
+    # dataclasses that json.dumps rejects, and sorts dicts nested in tuples
+    # (YAML never yields tuples). Only plain dict/list/str/int/bool/None trees
+    # take the fast path; the passthrough flags and the TypeError fallback
+    # (>64-bit ints) keep anything that slips through on canonical_bytes.
+    if orjson is not None and is_plain_json(data):
+        try:
+            return orjson.dumps(
+                data,
+                option=orjson.OPT_SORT_KEYS
+                | orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS
+            )
+        except TypeError:
+            pass
+    return canonical_bytes(data)
 
 
 def to_deterministic_json(data: Dict[str, Any]) -> str:
     """Serialize to deterministic JSON following cross-language standards."""
-    def convert_special_values(obj: Any) -> Any:
-        """Convert NaN and Infinity to null for deterministic output."""
-        if isinstance(obj, float):
-            if obj != obj:  # NaN check
-                return None
-            if obj == float("inf") or obj == float("-inf"):
-                return None
-        return obj
-
-    def process_data(obj: Any) -> Any:
-        if isinstance(obj, dict):
-            return {key: process_data(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [process_data(item) for item in obj]
-        else:
-            return convert_special_values(obj)
-
-    sorted_data = sort_object(data)
-    processed_data = process_data(sorted_data)
-    return json.dumps(processed_data, separators=(",", ":"), ensure_ascii=False)
+    return to_deterministic_bytes(data).decode("utf-8")
+
+
+def hash_deterministic_bytes(manifest: bytes) -> str:
+    """Calculate SHA256 hash of already-canonical app compose bytes."""
+    digest = hashlib.new("sha256", usedforsecurity=True)
+    view = memoryview(manifest)
+    for offset in range(0, len(view), HASH_CHUNK_SIZE):
+        digest.update(view[offset:offset + HASH_CHUNK_SIZE])
+    return digest.hexdigest()
 
 
 def get_compose_hash(app_compose_data: Dict[str, Any]) -> str:
     """Calculate SHA256 hash of app compose configuration."""
-    manifest_str = to_deterministic_json(app_compose_data)
-    return hashlib.sha256(manifest_str.encode("utf-8")).hexdigest()
+    return hash_deterministic_bytes(to_deterministic_bytes(app_compose_data))
 
 
 def docker_compose_to_app_compose(docker_compose_path: str) -> Dict[str, Any]:
     """Convert docker-compose.yml to app-compose.json equivalent"""
     with open(docker_compose_path, 'r') as f:
-        docker_config = yaml.safe_load(f)
+        docker_config = yaml.load(f, Loader=SafeLoader)
 
     # Extract the primary service configuration
     services = docker_config.get('services', {})
@@ -111,14 +128,15 @@ def main():
         json.dump(app_compose_data, f, indent=2)
 
     # Generate deterministic JSON for hash calculation
-    deterministic_json = to_deterministic_json(app_compose_data)
-    with open('app-compose-deterministic.json', 'w') as f:
-        f.write(deterministic_json)
+    deterministic_bytes = to_deterministic_bytes(app_compose_data)
+    with open('app-compose-deterministic.json', 'wb') as f:
+        f.write(deterministic_bytes)
 
-    # Generate hash
-    compose_hash = get_compose_hash(app_compose_data)
+    # Generate hash from the same bytes instead of re-serializing
+    compose_hash = hash_deterministic_bytes(deterministic_bytes)
 
     print(f"App Compose Hash: {compose_hash}")
+    print(f"SHA256 backend: {SHA256_BACKEND}")
     print(f"Hash (first 40 chars): {compose_hash[:40]}")
 
     # Save hash for verification
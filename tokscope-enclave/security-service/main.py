@@ -3,11 +3,17 @@ Xordi Security Header Service
 FastAPI service for generating TikTok security headers (X-Gorgon, X-Argus, X-Ladon)
 """
 
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+import orjson
+import asyncio
 import time
+import json
+import email.message
+import functools
 import logging
+import threading
 from typing import Optional
 import sys
 import os
@@ -26,23 +32,89 @@ except ImportError as e:
     print("Make sure all required files are in the lib/ directory")
     sys.exit(1)
 
+# Generators are created once per worker. XGorgon, XArgus and XLadon keep no
+# per-call state; TTEncrypt does (carry flag, content buffers), so it is locked.
+MODULE_STATUS = {}
+MODULE_ERRORS = {}
+
+def _init_module(name, factory):
+    """Construct a generator at startup, recording the outcome for /test"""
+    try:
+        instance = factory()
+        MODULE_STATUS[name] = "✅ Loaded"
+        return instance
+    except Exception as e:
+        MODULE_STATUS[name] = f"❌ Failed: {e}"
+        MODULE_ERRORS[name] = str(e)
+        return None
+
+def _require_modules(*names):
+    """Raise a generator's construction error so the request fails with 500"""
+    for name in names:
+        if name in MODULE_ERRORS:
+            raise RuntimeError(MODULE_ERRORS[name])
+
+GORGON = _init_module("XGorgon", XGorgon)
+ARGUS = _init_module("XArgus", XArgus)
+LADON = _init_module("XLadon", XLadon)
+TT_ENCRYPT = _init_module("TTEncrypt", TTEncrypt)
+TT_ENCRYPT_LOCK = threading.Lock()
+
+# X-Ladon's random salt is drawn once at import (XLadon's urandom default), so
+# within a worker the value depends only on the timestamp second
+@functools.lru_cache(maxsize=4096)
+def ladon_for_timestamp(timestamp: int) -> str:
+    return LADON.encrypt(timestamp)
+
 app = FastAPI(
     title="Xordi Security Header Service",
     version="2.2.0",
     description="Generate security headers for TikTok mobile API requests"
 )
 
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# CORS headers, rendered once; only browsers need them
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+CORS_PREFLIGHT_HEADERS = CORS_HEADERS + [
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"*"),
+    (b"access-control-max-age", b"600"),
+    (b"content-length", b"0"),
+]
+
+class StaticCORSMiddleware:
+    """
+    Minimal CORS for browser callers: appends pre-rendered headers to every
+    response and answers OPTIONS preflights without reaching the app
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+        if scope["method"] == "OPTIONS":
+            await send({"type": "http.response.start", "status": 200, "headers": CORS_PREFLIGHT_HEADERS})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + CORS_HEADERS
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+# The Node enclave and mobile clients call this service directly, so CORS is
+# opt-in (ENABLE_CORS=1) for browser-based tooling
+if os.environ.get("ENABLE_CORS") == "1":
+    app.add_middleware(StaticCORSMiddleware)
+
+# Configure logging (WARNING unless LOG_LEVEL says otherwise)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 class HeaderRequest(BaseModel):
@@ -59,120 +131,223 @@ class DeviceRegistrationRequest(BaseModel):
     device_id: Optional[str] = None
     install_id: Optional[str] = None
 
-@app.get("/")
-def root():
+def _render_json(content) -> bytes:
+    """Encode a response body the way FastAPI's JSONResponse would"""
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# Static responses are rendered once at startup instead of per request
+ROOT_BYTES = _render_json({
+    "service": "Xordi Security Header Service",
+    "version": "2.2.0",
+    "status": "running"
+})
+HEALTH_TEMPLATE = b'{"status":"healthy","service":"security-headers","timestamp":%d}'
+TEST_BYTES = _render_json({
+    "status": "test_complete",
+    "modules": MODULE_STATUS
+})
+
+@app.get("/", response_class=Response)
+async def root():
     """Root endpoint"""
-    return {
-        "service": "Xordi Security Header Service",
-        "version": "2.2.0",
-        "status": "running"
-    }
+    return Response(ROOT_BYTES, media_type="application/json")
 
-@app.get("/health")
-def health_check():
+@app.get("/health", response_class=Response)
+async def health_check():
     """Health check endpoint"""
+    return Response(HEALTH_TEMPLATE % int(time.time()), media_type="application/json")
+
+def _gorgon_headers(request: HeaderRequest, timestamp: int):
+    """Generate X-Gorgon and X-Khronos, falling back to a zero signature"""
+    try:
+        # Build headers dict for XGorgon calculation
+        headers_dict = {}
+        if request.cookies:
+            headers_dict['cookie'] = request.cookies
+        if request.stub:
+            headers_dict['x-ss-stub'] = request.stub
+
+        gorgon_result = GORGON.calculate(
+            params=request.params,
+            headers=headers_dict
+        )
+
+        # Handle different return formats from XGorgon
+        if isinstance(gorgon_result, dict):
+            x_gorgon = gorgon_result.get("X-Gorgon", "0404000000000000000000000000000000000000")
+            x_khronos = gorgon_result.get("X-Khronos", str(timestamp))
+        else:
+            x_gorgon = str(gorgon_result)
+            x_khronos = str(timestamp)
+
+    except Exception as e:
+        logger.error("X-Gorgon generation failed: %s", e)
+        # Provide fallback value
+        x_gorgon = "0404000000000000000000000000000000000000"
+        x_khronos = str(timestamp)
+
+    return x_gorgon, x_khronos
+
+def _argus_header(request: HeaderRequest, timestamp: int) -> str:
+    """Generate X-Argus, falling back to a placeholder"""
+    try:
+        x_argus = ARGUS.get_sign(
+            params=request.params,
+            stub=request.stub or "",
+            timestamp=timestamp
+        )
+        if not x_argus:
+            x_argus = "placeholder_argus_value"
+    except Exception as e:
+        logger.error("X-Argus generation failed: %s", e)
+        x_argus = "placeholder_argus_value"
+    return x_argus
+
+def _ladon_header(timestamp: int) -> str:
+    """Generate X-Ladon, falling back to a placeholder"""
+    try:
+        x_ladon = ladon_for_timestamp(timestamp)
+        if not x_ladon:
+            x_ladon = "placeholder_ladon_value"
+    except Exception as e:
+        logger.error("X-Ladon generation failed: %s", e)
+        x_ladon = "placeholder_ladon_value"
+    return x_ladon
+
+def _serial_headers(request: HeaderRequest, timestamp: int):
+    """Generate all headers one after another on the calling thread"""
+    x_gorgon, x_khronos = _gorgon_headers(request, timestamp)
+    return x_gorgon, x_khronos, _argus_header(request, timestamp), _ladon_header(timestamp)
+
+async def build_header_response(request: HeaderRequest) -> dict:
+    """
+    Compute the X-Gorgon, X-Argus, X-Ladon header response body
+
+    The CPU-bound generators run together in a single worker thread so the
+    event loop stays free.
+    """
+    # A generator that failed to construct must not fall through to the
+    # per-header placeholder values
+    _require_modules("XGorgon", "XArgus", "XLadon")
+
+    timestamp = request.timestamp or int(time.time())
+
+    logger.info("Generating headers for params: %.50s...", request.params)
+
+    x_gorgon, x_khronos, x_argus, x_ladon = await asyncio.to_thread(
+        _serial_headers, request, timestamp
+    )
+
+    headers = {
+        "X-Gorgon": x_gorgon,
+        "X-Khronos": x_khronos,
+        "X-Argus": x_argus,
+        "X-Ladon": x_ladon
+    }
+
+    logger.info("Headers generated successfully")
+
     return {
-        "status": "healthy",
-        "service": "security-headers",
-        "timestamp": int(time.time())
+        "success": True,
+        "headers": headers,
+        "timestamp": timestamp
+    }
+
+# Declared for OpenAPI only; the endpoint validates the raw body itself
+HEADER_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": HeaderRequest.model_json_schema()}}
     }
+}
+
+def is_json_content_type(content_type: Optional[str]) -> bool:
+    """Mirror FastAPI's check for whether a body param is parsed as JSON"""
+    if not content_type:
+        return True
+    message = email.message.Message()
+    message["content-type"] = content_type
+    if message.get_content_maintype() != "application":
+        return False
+    subtype = message.get_content_subtype()
+    return subtype == "json" or subtype.endswith("+json")
 
-@app.post("/generate-headers")
-def generate_headers(request: HeaderRequest):
+def header_validation_error(body: bytes, exc: ValidationError, is_json: bool) -> Exception:
+    """Rebuild a pydantic error in the shape FastAPI reports for body params"""
+    parsed = body
+    if is_json:
+        # Only the failure path pays for the extra parse; it recovers FastAPI's
+        # "JSON decode error" detail with the byte position of the syntax error
+        try:
+            parsed = json.loads(body)
+        except json.JSONDecodeError as e:
+            return RequestValidationError([{
+                "type": "json_invalid",
+                "loc": ("body", e.pos),
+                "msg": "JSON decode error",
+                "input": {},
+                "ctx": {"error": e.msg}
+            }], body=e.doc)
+        except UnicodeDecodeError:
+            return HTTPException(status_code=400, detail="There was an error parsing the body")
+    return RequestValidationError(
+        [{**err, "loc": ("body", *err["loc"])} for err in exc.errors()],
+        body=parsed
+    )
+
+@app.post("/generate-headers", response_class=Response, openapi_extra=HEADER_REQUEST_BODY)
+async def generate_headers(request: Request):
     """
     Generate X-Gorgon, X-Argus, X-Ladon headers for TikTok API requests
     """
+    body = await request.body()
+    if not body:
+        raise RequestValidationError([{
+            "type": "missing",
+            "loc": ("body",),
+            "msg": "Field required",
+            "input": None
+        }], body=None)
+
+    is_json = is_json_content_type(request.headers.get("content-type"))
     try:
-        timestamp = request.timestamp or int(time.time())
-        
-        logger.info(f"Generating headers for params: {request.params[:50]}...")
-        
-        # Initialize generators
-        gorgon_gen = XGorgon()
-        argus_gen = XArgus()
-        ladon_gen = XLadon()
-        
-        # Generate X-Gorgon and X-Khronos
-        try:
-            # Build headers dict for XGorgon calculation
-            headers_dict = {}
-            if request.cookies:
-                headers_dict['cookie'] = request.cookies
-            if request.stub:
-                headers_dict['x-ss-stub'] = request.stub
-                
-            gorgon_result = gorgon_gen.calculate(
-                params=request.params,
-                headers=headers_dict
-            )
-            
-            # Handle different return formats from XGorgon
-            if isinstance(gorgon_result, dict):
-                x_gorgon = gorgon_result.get("X-Gorgon", "0404000000000000000000000000000000000000")
-                x_khronos = gorgon_result.get("X-Khronos", str(timestamp))
-            else:
-                x_gorgon = str(gorgon_result)
-                x_khronos = str(timestamp)
-                
-        except Exception as e:
-            logger.error(f"X-Gorgon generation failed: {e}")
-            # Provide fallback value
-            x_gorgon = "0404000000000000000000000000000000000000"
-            x_khronos = str(timestamp)
-        
-        # Generate X-Argus
-        try:
-            x_argus = argus_gen.get_sign(
-                params=request.params,
-                stub=request.stub or "",
-                timestamp=timestamp
-            )
-            if not x_argus:
-                x_argus = "placeholder_argus_value"
-        except Exception as e:
-            logger.error(f"X-Argus generation failed: {e}")
-            x_argus = "placeholder_argus_value"
-        
-        # Generate X-Ladon
-        try:
-            x_ladon = ladon_gen.encrypt(timestamp)
-            if not x_ladon:
-                x_ladon = "placeholder_ladon_value"
-        except Exception as e:
-            logger.error(f"X-Ladon generation failed: {e}")
-            x_ladon = "placeholder_ladon_value"
-        
-        headers = {
-            "X-Gorgon": x_gorgon,
-            "X-Khronos": x_khronos,
-            "X-Argus": x_argus,
-            "X-Ladon": x_ladon
-        }
-        
-        logger.info("Headers generated successfully")
-        
-        return {
-            "success": True,
-            "headers": headers,
-            "timestamp": timestamp
-        }
+        if is_json:
+            # Validate straight from bytes in pydantic-core, skipping FastAPI's
+            # json.loads + dict validation + jsonable_encoder round trip
+            header_request = HeaderRequest.model_validate_json(body)
+        else:
+            # FastAPI hands non-JSON bodies to the model as raw bytes, which
+            # fails validation; reproduce that rather than parsing them
+            header_request = HeaderRequest.model_validate(body, from_attributes=True)
+    except ValidationError as e:
+        raise header_validation_error(body, e, is_json)
+
+    try:
+        result = await build_header_response(header_request)
+        return Response(orjson.dumps(result), media_type="application/json")
         
     except Exception as e:
-        logger.error(f"Header generation failed: {e}")
+        logger.error("Header generation failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _register_device(device_id: Optional[str], install_id: Optional[str]):
+    """Run device registration on the shared, stateful TTEncrypt instance"""
+    _require_modules("TTEncrypt")
+    with TT_ENCRYPT_LOCK:
+        return TT_ENCRYPT.register_device(
+            device_id=device_id,
+            install_id=install_id
+        )
+
 @app.post("/register-device")
-def register_device(request: DeviceRegistrationRequest):
+async def register_device(request: DeviceRegistrationRequest):
     """
     Register a new device with TikTok servers
     """
     try:
-        tt_encrypt = TTEncrypt()
-        
         # Generate device registration
-        result = tt_encrypt.register_device(
-            device_id=request.device_id,
-            install_id=request.install_id
+        result = await asyncio.to_thread(
+            _register_device, request.device_id, request.install_id
         )
         
         return {
@@ -181,60 +356,50 @@ def register_device(request: DeviceRegistrationRequest):
         }
         
     except Exception as e:
-        logger.error(f"Device registration failed: {e}")
+        logger.error("Device registration failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/test")
-def test_modules():
+@app.get("/stats")
+async def cache_stats():
+    """Header cache hit/miss counters for this worker"""
+    info = ladon_for_timestamp.cache_info()
+    return {
+        "ladon_cache": {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize
+        }
+    }
+
+@app.get("/test", response_class=Response)
+async def test_modules():
     """
     Test that all security modules are working
     """
-    try:
-        results = {}
-        
-        # Test XGorgon
-        try:
-            gorgon = XGorgon()
-            results["XGorgon"] = "✅ Loaded"
-        except Exception as e:
-            results["XGorgon"] = f"❌ Failed: {e}"
-        
-        # Test XArgus
-        try:
-            argus = XArgus()
-            results["XArgus"] = "✅ Loaded"
-        except Exception as e:
-            results["XArgus"] = f"❌ Failed: {e}"
-        
-        # Test XLadon
-        try:
-            ladon = XLadon()
-            results["XLadon"] = "✅ Loaded"
-        except Exception as e:
-            results["XLadon"] = f"❌ Failed: {e}"
-        
-        # Test TTEncrypt
-        try:
-            tt = TTEncrypt()
-            results["TTEncrypt"] = "✅ Loaded"
-        except Exception as e:
-            results["TTEncrypt"] = f"❌ Failed: {e}"
-        
-        return {
-            "status": "test_complete",
-            "modules": results
-        }
-        
-    except Exception as e:
-        return {
-            "status": "error",
-            "error": str(e)
-        }
+    # Module construction happens once at import, so the result never changes
+    return Response(TEST_BYTES, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8100))
     host = os.environ.get("HOST", "0.0.0.0")
+    # Header generation is CPU-bound, so scale across the cores this process may
+    # run on (affinity respects cpusets, unlike os.cpu_count()); each worker
+    # imports this module itself and builds its own generator singletons
+    if "WORKERS" in os.environ:
+        workers = int(os.environ["WORKERS"])
+    elif hasattr(os, "sched_getaffinity"):
+        workers = len(os.sched_getaffinity(0))
+    else:
+        workers = 1
     
-    print(f"Starting Xordi Security Header Service on {host}:{port}")
-    uvicorn.run(app, host=host, port=port)
\ No newline at end of file
+    print(f"Starting Xordi Security Header Service on {host}:{port} ({workers} workers)")
+    uvicorn.run(
+        "main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        log_level=LOG_LEVEL.lower()
+    )
\ No newline at end of file
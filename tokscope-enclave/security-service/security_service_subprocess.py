@@ -2,15 +2,21 @@
 """
 Python Security Service Subprocess
 Runs inside tokscope-enclave container, communicates via stdin/stdout
+
+IPC framing: each request and response is a 4-byte big-endian length
+followed by that many bytes of UTF-8 JSON.
 """
 
+import os
 import sys
-import json
+import binascii
+import orjson
+import functools
 import logging
+import re
 import time
-import secrets
-from typing import Dict, Any
-from urllib.parse import urlencode
+from typing import Dict, Any, List, Tuple
+from urllib.parse import quote_plus
 
 # Add security-service directory to path so lib/ is a package
 sys.path.insert(0, '/app/security-service')
@@ -23,18 +29,66 @@ from lib.TTEncrypt import TT as TTEncrypt
 
 # Configure logging to stderr (stdout used for IPC)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'WARNING').upper(),
     stream=sys.stderr,
     format='[Python] %(levelname)s: %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+COOKIE_CACHE_SIZE = 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+class _StubPool:
+    """Hands out random 16-byte x-ss-stub values from a buffer filled by os.urandom
+
+    Each byte is handed out once; a 256-byte pool trades one syscall for 16
+    stubs while keeping little unused randomness resident in memory.
+    """
+
+    STUB_SIZE = 16
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.buf = os.urandom(size)
+        self.offset = 0
+
+    def next(self) -> str:
+        if self.offset + self.STUB_SIZE > self.size:
+            self.buf = os.urandom(self.size)
+            self.offset = 0
+        chunk = self.buf[self.offset:self.offset + self.STUB_SIZE]
+        self.offset += self.STUB_SIZE
+        return binascii.hexlify(chunk).decode()
+
+_STUB_POOL = _StubPool()
+
+# Deterministic per process: XLadon fixes its random salt at import time
+@functools.lru_cache(maxsize=4096)
+def ladon_for_timestamp(timestamp: int) -> str:
+    return XLadon.encrypt(timestamp=timestamp)
+
+# Characters quote_plus never escapes; values made only of these pass through as-is
+_QUERY_SAFE = re.compile(r'[A-Za-z0-9_.~-]*').fullmatch
+
+def build_query_string(params: Dict[str, Any]) -> str:
+    """Equivalent to urlencode(params), skipping quote_plus for already-safe keys and values"""
+    parts = []
+    for key, value in params.items():
+        key = key if isinstance(key, str) else str(key)
+        value = value if isinstance(value, str) else str(value)
+        parts.append(
+            (key if _QUERY_SAFE(key) else quote_plus(key)) + '=' +
+            (value if _QUERY_SAFE(value) else quote_plus(value))
+        )
+    return '&'.join(parts)
+
 class SecurityServiceSubprocess:
     def __init__(self):
         self.gorgon = XGorgon()
         self.argus = XArgus()
-        self.ladon = XLadon()
         self.encrypt = TTEncrypt()
+        # sec_user_id -> (cookie list, serialized cookie header)
+        self._cookie_cache: Dict[str, Tuple[List[Dict[str, Any]], str]] = {}
         logger.info("Security modules initialized")
 
     def generate_headers(self, params: str, cookies: str, stub: str, timestamp: int) -> Dict[str, str]:
@@ -59,7 +113,7 @@ class SecurityServiceSubprocess:
             )
 
             # Generate X-Ladon
-            ladon_value = self.ladon.encrypt(timestamp=timestamp)
+            ladon_value = ladon_for_timestamp(timestamp)
 
             return {
                 'X-Gorgon': gorgon_result.get('X-Gorgon', ''),
@@ -68,14 +122,37 @@ class SecurityServiceSubprocess:
                 'X-Ladon': ladon_value
             }
         except Exception as e:
-            logger.error(f"Header generation failed: {e}")
+            logger.error("Header generation failed: %s", e)
             raise
 
+    def cookie_header(self, session_data: Dict[str, Any]) -> str:
+        """Serialize session cookies to a Cookie header, reusing the last result per session"""
+        cookies = session_data['cookies']
+        # Only cache for well-formed sessions; anything else builds the header
+        # uncached, as before, rather than failing the request
+        user = session_data.get('user')
+        session_id = user.get('sec_user_id') if isinstance(user, dict) else None
+        if not isinstance(session_id, str):
+            session_id = None
+
+        # Each IPC request decodes a fresh list, so validate hits by content;
+        # list equality runs in C and is cheaper than rebuilding the string
+        cached = self._cookie_cache.get(session_id) if session_id else None
+        if cached and cached[0] == cookies:
+            return cached[1]
+
+        header = '; '.join(f"{c['name']}={c['value']}" for c in cookies)
+        if session_id:
+            if len(self._cookie_cache) >= COOKIE_CACHE_SIZE:
+                self._cookie_cache.clear()
+            self._cookie_cache[session_id] = (cookies, header)
+        return header
+
     def build_authenticated_params(self, base_params: Dict[str, Any], session_data: Dict[str, Any]) -> Dict[str, Any]:
         """Build authenticated params with security headers"""
         try:
             timestamp = int(time.time())
-            stub = secrets.token_hex(16)
+            stub = _STUB_POOL.next()
 
             # Merge base params
             params = {**base_params}
@@ -89,13 +166,13 @@ class SecurityServiceSubprocess:
                     params['iid'] = tokens['install_id']
 
             # Build query string
-            params_string = urlencode(params)
+            params_string = build_query_string(params)
 
             # Get cookies from session
             cookies = ''
             if 'cookies' in session_data and session_data['cookies']:
                 if isinstance(session_data['cookies'], list):
-                    cookies = '; '.join([f"{c['name']}={c['value']}" for c in session_data['cookies']])
+                    cookies = self.cookie_header(session_data)
                 elif isinstance(session_data['cookies'], str):
                     cookies = session_data['cookies']
 
@@ -108,7 +185,7 @@ class SecurityServiceSubprocess:
             return params
 
         except Exception as e:
-            logger.error(f"buildAuthenticatedParams failed: {e}")
+            logger.error("buildAuthenticatedParams failed: %s", e)
             raise
 
     def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -156,7 +233,7 @@ class SecurityServiceSubprocess:
         elif action == 'generateHeaders':
             params = request.get('params', '')
             cookies = request.get('cookies', '')
-            stub = request.get('stub', secrets.token_hex(16))
+            stub = request['stub'] if 'stub' in request else _STUB_POOL.next()
             timestamp = request.get('timestamp', int(time.time()))
 
             headers = self.generate_headers(params, cookies, stub, timestamp)
@@ -167,6 +244,18 @@ class SecurityServiceSubprocess:
                 'headers': headers
             }
 
+        elif action == 'getCacheStats':
+            info = ladon_for_timestamp.cache_info()
+            return {
+                'success': True,
+                'requestId': request_id,
+                'ladonCache': {
+                    'hits': info.hits,
+                    'misses': info.misses,
+                    'size': info.currsize
+                }
+            }
+
         else:
             return {
                 'success': False,
@@ -174,40 +263,64 @@ class SecurityServiceSubprocess:
                 'error': f'Unknown action: {action}'
             }
 
-    def run(self):
-        """Main loop - read from stdin, write to stdout"""
-        logger.info("Security service subprocess started, waiting for requests...")
+    def write_frame(self, response: Dict[str, Any]):
+        """Write one length-prefixed JSON response with a single write"""
+        body = orjson.dumps(response)
+        out = sys.stdout.buffer
+        out.write(len(body).to_bytes(4, 'big') + body)
+        out.flush()
 
+    def read_frames(self, fd: int = 0):
+        """Yield request bodies from length-prefixed frames on fd
+
+        Reads in large chunks with os.read so frames pipelined by the parent
+        are split out of one buffer instead of costing a read call each.
+        """
+        buf = bytearray()
         while True:
-            try:
-                # Read line from stdin
-                line = sys.stdin.readline()
-                if not line:
+            chunk = os.read(fd, READ_CHUNK_SIZE)
+            if not chunk:
+                return
+            buf += chunk
+
+            start = 0
+            while len(buf) - start >= 4:
+                end = start + 4 + int.from_bytes(buf[start:start + 4], 'big')
+                if len(buf) < end:
                     break
+                yield bytes(buf[start + 4:end])
+                start = end
+            del buf[:start]
 
+    def run(self):
+        """Main loop - read framed requests from stdin, write framed responses to stdout"""
+        logger.info("Security service subprocess started, waiting for requests...")
+
+        for body in self.read_frames(sys.stdin.fileno()):
+            try:
                 # Parse JSON request
-                request = json.loads(line.strip())
+                request = orjson.loads(body)
 
                 # Handle request
                 response = self.handle_request(request)
 
                 # Write JSON response to stdout
-                print(json.dumps(response), flush=True)
+                self.write_frame(response)
 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 error_response = {
                     'success': False,
                     'error': f'Invalid JSON: {e}'
                 }
-                print(json.dumps(error_response), flush=True)
+                self.write_frame(error_response)
 
             except Exception as e:
-                logger.error(f"Request handling error: {e}", exc_info=True)
+                logger.error("Request handling error: %s", e, exc_info=True)
                 error_response = {
                     'success': False,
                     'error': str(e)
                 }
-                print(json.dumps(error_response), flush=True)
+                self.write_frame(error_response)
 
 if __name__ == '__main__':
     service = SecurityServiceSubprocess()
@@ -2,11 +2,11 @@
  * Xordi Security Module - Python Subprocess Wrapper
  * Runs Python security service as subprocess in same container
  * Communication via stdin/stdout (IPC, not HTTP)
+ * Messages are framed as a 4-byte big-endian length followed by UTF-8 JSON
  */
 
 const { spawn } = require('child_process');
 const path = require('path');
-const readline = require('readline');
 const { log } = require('./lib/log');
 
 class PythonSecurityModule {
@@ -15,6 +15,7 @@ class PythonSecurityModule {
     this.requestId = 0;
     this.pendingRequests = new Map();
     this.isReady = false;
+    this.stdoutBuffer = Buffer.alloc(0);
   }
 
   async initialize() {
@@ -38,28 +39,20 @@ class PythonSecurityModule {
       console.log(`[Python Subprocess] ${data.toString().trim()}`);
     });
 
-    // Handle stdout (responses)
-    const rl = readline.createInterface({
-      input: this.pythonProcess.stdout
-    });
-
-    rl.on('line', (line) => {
-      try {
-        const response = JSON.parse(line);
-        const requestId = response.requestId;
+    // Handle stdout (length-prefixed responses)
+    this.stdoutBuffer = Buffer.alloc(0);
+    this.pythonProcess.stdout.on('data', (chunk) => {
+      this.stdoutBuffer = this.stdoutBuffer.length
+        ? Buffer.concat([this.stdoutBuffer, chunk])
+        : chunk;
 
-        if (this.pendingRequests.has(requestId)) {
-          const { resolve, reject } = this.pendingRequests.get(requestId);
-          this.pendingRequests.delete(requestId);
+      while (this.stdoutBuffer.length >= 4) {
+        const length = this.stdoutBuffer.readUInt32BE(0);
+        if (this.stdoutBuffer.length < 4 + length) break;
 
-          if (response.success) {
-            resolve(response);
-          } else {
-            reject(new Error(response.error || 'Unknown error'));
-          }
-        }
-      } catch (error) {
-        console.error('Failed to parse Python response:', error);
+        const body = this.stdoutBuffer.subarray(4, 4 + length);
+        this.stdoutBuffer = this.stdoutBuffer.subarray(4 + length);
+        this.handleResponse(body);
       }
     });
 
@@ -82,6 +75,26 @@ class PythonSecurityModule {
     console.log('✅ Python security service subprocess ready');
   }
 
+  handleResponse(body) {
+    try {
+      const response = JSON.parse(body.toString('utf8'));
+      const requestId = response.requestId;
+
+      if (this.pendingRequests.has(requestId)) {
+        const { resolve, reject } = this.pendingRequests.get(requestId);
+        this.pendingRequests.delete(requestId);
+
+        if (response.success) {
+          resolve(response);
+        } else {
+          reject(new Error(response.error || 'Unknown error'));
+        }
+      }
+    } catch (error) {
+      console.error('Failed to parse Python response:', error);
+    }
+  }
+
   async sendRequest(action, data = {}) {
     if (!this.isReady) {
       await this.initialize();
@@ -98,8 +111,11 @@ class PythonSecurityModule {
       // Store promise callbacks
       this.pendingRequests.set(requestId, { resolve, reject });
 
-      // Send request to Python subprocess
-      this.pythonProcess.stdin.write(JSON.stringify(request) + '\n');
+      // Send length-prefixed request to Python subprocess
+      const body = Buffer.from(JSON.stringify(request), 'utf8');
+      const header = Buffer.alloc(4);
+      header.writeUInt32BE(body.length, 0);
+      this.pythonProcess.stdin.write(Buffer.concat([header, body]));
 
       // Timeout after 30 seconds
       const timeoutStart = Date.now();